@@ -1,6 +1,21 @@
 import openai
 import tiktoken
 import argparse
+import asyncio
+import httpx
+import functools
+import sys
+import re
+import shutil
+import contextlib
+import importlib.util
+from difflib import SequenceMatcher
+from html import escape
+
+try:
+    import orjson
+except ImportError: #optional, responses are decoded with the json module if it's missing
+    orjson = None
 
 #base prompt for brainstorming
 brainstorming_prompt = """
@@ -30,17 +45,80 @@ The following is a conversation between two superhuman AI agents trying to solve
 Synthesize the above conversation into an extremely detailed, coherent, complete proposal to solve the problem.
 """.strip()
 
+#prompt for reformatting the synthesis as an HTML report
+report_prompt = """
+###START REPORT
+{synthesis}
+###END REPORT
+
+Reformat the above write-up via HTML into a professional-looking report. Use Times New Roman
+<!DOCTYPE html>
+""".strip()
+
+#prompt for picking the best of several independently brainstormed proposals
+ranking_prompt = """
+Problem: {problem}{additional}
+
+The following are {n} proposals to solve the above problem:
+
+{proposals}
+
+Which proposal is the most detailed, sound, and complete solution to the problem? Answer with the number of the proposal only.
+""".strip()
+
+#plain HTML page for reports too short to be worth having GPT format
+report_template = """
+<!DOCTYPE html>
+<html>
+<body style="font-family: 'Times New Roman', serif;">
+{body}
+</body>
+</html>
+""".strip()
+
+def _build_messages(input_messages, system_prompt, starter="user"):
+    '''
+    Builds the chat messages for chat_GPT/achat_GPT, alternating the roles of input_messages starting with starter
+    '''
+    roles = ("user", "assistant") if starter == "user" else ("assistant", "user")
+    return [{"role": "system", "content": system_prompt}] + [{"role": roles[i % 2], "content": message} for i, message in enumerate(input_messages)]
+
+aclient = None #async OpenAI client shared by all requests, see _get_aclient
+
+async def _decode_with_orjson(response):
+    '''
+    httpx response hook making response.json() decode with orjson, which the SDK calls on non-streamed responses once it has read the body
+    '''
+    response.json = lambda **kwargs: orjson.loads(response.content)
+
+def _get_aclient():
+    '''
+    Returns the async OpenAI client shared by all requests, keeping connections alive between the (often slow) turns.
+    A new client is created on first use, and again if the previous one was closed (main closes it when it's done)
+    '''
+    global aclient
+    if aclient is None or aclient.is_closed():
+        aclient = openai.AsyncOpenAI(
+              api_key=openai.api_key,
+              http_client=openai.DefaultAsyncHttpxClient(
+                  limits=httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=60),
+                  http2=importlib.util.find_spec("h2") is not None, #HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+                  event_hooks={"response": [_decode_with_orjson]} if orjson is not None else None
+                )
+            )
+    return aclient
+
 def query_GPT(prompt, max_tokens=512, engine="gpt-3.5-turbo", temp=0.8, top_p=0.95):
     '''
     Literally just a wrapper function that queries GPT
     '''
-    return openai.ChatCompletion.create(
+    return openai.chat.completions.create(
           model=engine,
           messages=[{"role": "user", "content": prompt}],
           max_tokens=max_tokens,
           temperature=temp,
           top_p=top_p
-        )['choices'][0]['message']['content']
+        ).choices[0].message.content
 
 def chat_GPT(input_messages, system_prompt, starter="user", max_tokens=512, engine="gpt-3.5-turbo", temp=0.8, top_p=0.95):
     """
@@ -58,121 +136,404 @@ def chat_GPT(input_messages, system_prompt, starter="user", max_tokens=512, engi
     Returns:
         str: The generated assistant message in response to the conversation.
     """
-    messages = [{"role": "system", "content": system_prompt}]
-
-    for i, message in enumerate(input_messages):
-        if i % 2 == (0 if starter == "user" else 1):
-            messages.append({"role": "user", "content": message})
-        else:
-            messages.append({"role": "assistant", "content": message})
+    messages = _build_messages(input_messages, system_prompt, starter)
 
-    return openai.ChatCompletion.create(
+    return openai.chat.completions.create(
           model=engine,
           messages=messages,
           max_tokens=max_tokens,
           temperature=temp,
           top_p=top_p
-        )['choices'][0]['message']['content']
+        ).choices[0].message.content
+
+async def acomplete_GPT(messages, max_tokens=512, engine="gpt-3.5-turbo", temp=0.8, top_p=0.95, stream=False):
+    """
+    Send an already built list of chat messages to GPT as is.
+
+    Args:
+        messages (list): The chat messages, as {"role": ..., "content": ...} dicts.
+        max_tokens (int, optional): The maximum number of tokens in the generated response. Defaults to 512.
+        engine (str, optional): The OpenAI engine to use for the conversation. Defaults to "gpt-3.5-turbo".
+        temp (float, optional): The temperature for sampling, controlling randomness. Defaults to 0.8.
+        top_p (float, optional): The nucleus sampling parameter, controlling diversity. Defaults to 0.95.
+        stream (bool, optional): Whether to echo the response to stdout as it is generated. Defaults to False.
+
+    Returns:
+        tuple: The generated message and the number of tokens in it (None if the endpoint didn't report it).
+    """
+    response = await _get_aclient().chat.completions.create(
+          model=engine,
+          messages=messages,
+          max_tokens=max_tokens,
+          temperature=temp,
+          top_p=top_p,
+          stream=stream,
+          stream_options={"include_usage": True} if stream else openai.NOT_GIVEN
+        )
+    if not stream:
+        return response.choices[0].message.content, response.usage.completion_tokens if response.usage else None
+
+    #the usage comes in a final chunk with no choices, endpoints that ignore stream_options never send it
+    buf = []
+    started = False #whether any non-whitespace has been echoed yet
+    completion_tokens = None
+    async for chunk in response:
+        if chunk.usage:
+            completion_tokens = chunk.usage.completion_tokens
+        if chunk.choices and chunk.choices[0].delta.content:
+            delta = chunk.choices[0].delta.content
+            #don't echo the leading whitespace the reply usually starts with, it ends up after a "Label: " prefix
+            echo = delta if started else delta.lstrip()
+            started = started or bool(echo)
+            buf.append(delta)
+            sys.stdout.write(echo)
+            sys.stdout.flush()
+    return "".join(buf), completion_tokens
+
+async def aquery_GPT(prompt, max_tokens=512, engine="gpt-3.5-turbo", temp=0.8, top_p=0.95, stream=False):
+    '''
+    Async version of query_GPT, optionally streaming the response to stdout.
+    Returns a (response, completion_tokens) tuple
+    '''
+    return await acomplete_GPT([{"role": "user", "content": prompt}], max_tokens, engine, temp, top_p, stream)
+
+async def achat_GPT(input_messages, system_prompt, starter="user", max_tokens=512, engine="gpt-3.5-turbo", temp=0.8, top_p=0.95, stream=False):
+    """
+    Async version of chat_GPT, see chat_GPT for a description of the arguments.
+
+    If stream is set, the response is echoed to stdout as it is generated.
+
+    Returns:
+        tuple: The generated assistant message and the number of tokens in it.
+    """
+    messages = _build_messages(input_messages, system_prompt, starter)
+
+    return await acomplete_GPT(messages, max_tokens, engine, temp, top_p, stream)
+
+@functools.lru_cache(maxsize=None)
+def _get_enc(name="cl100k_base"):
+    '''
+    Returns the tiktoken encoding with the given name, constructed only once per name
+    '''
+    return tiktoken.get_encoding(name)
 
-def compute_total_tokens(messages, enc):
+def compute_total_tokens(messages, enc=None):
     """
     Calculate the total number of tokens in a list of messages using a given encoder.
 
     Args:
         messages (list): A list of messages to calculate the total tokens for.
-        enc (object): An encoder object capable of encoding the messages into tokens.
+        enc (object, optional): An encoder object capable of encoding the messages into tokens. Defaults to the cached cl100k_base encoding.
 
     Returns:
         int: The total number of tokens in the given messages.
     """
+    enc = enc or _get_enc()
     message_string = "\n".join(messages)
-    return len(enc.encode(message_string))
+    return len(enc.encode_ordinary(message_string))
 
-if __name__ == "__main__":
-    openai.api_key = "<YOUR_API_KEY_HERE>"
-    enc = tiktoken.get_encoding("cl100k_base") #used to count tokens
+class TokenCounter:
+    """
+    Running token count of an append-only list of messages, so that each message only gets encoded once.
 
-    #argparser
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--temp", type=float, default=0.8)
-    parser.add_argument("--top_p", type=float, default=0.95)
-    parser.add_argument("--engine", type=str, default="gpt-3.5-turbo")
-    parser.add_argument("--max_len", type=int, default=2048)
-    args = parser.parse_args()
+    Args:
+        enc (object, optional): An encoder object capable of encoding the messages into tokens. Defaults to the cached cl100k_base encoding.
+    """
+    def __init__(self, enc=None):
+        self._enc = enc or _get_enc()
+        self.total = 0
+
+    def add(self, message, n_tokens=None):
+        """
+        Add the tokens of a newly appended message to the running total.
+
+        Args:
+            message (str): The message appended to the conversation.
+            n_tokens (int, optional): The number of tokens in the message if already known (e.g. from the API's usage), in which case the message isn't encoded.
+
+        Returns:
+            int: The number of tokens in the message.
+        """
+        n = n_tokens if n_tokens is not None else len(self._enc.encode_ordinary(message))
+        self.total += n + 1 #newline separating messages
+        return n
+
+def is_going_in_circles(previous, latest, ratio_threshold=0.85, jaccard_threshold=0.7):
+    """
+    Cheaply check whether two consecutive responses are near-duplicates, which means the conversation has stalled.
 
-    if args.engine == "gpt-3.5-turbo":
-        context_len = 4000
-    elif args.engine == "gpt-4":
-        context_len = 8000
+    Args:
+        previous (str): The earlier of the two responses.
+        latest (str): The later of the two responses.
+        ratio_threshold (float, optional): Character-level similarity above which the responses count as repeats. Defaults to 0.85.
+        jaccard_threshold (float, optional): Word-set Jaccard similarity above which the responses count as repeats. Defaults to 0.7.
 
-    print("Welcome to BrainstormGPT 🧠⛈️\n-----------------------------")
-    problem = input("Describe the problem you want to solve: ") #problem statement
-    additional = input("Describe any additional information you want to provide (leave blank if none): ") #any additional info
-    seed = input("Enter any initial proposals you have (leave blank if none): ") #seed idea
+    Returns:
+        bool: Whether the responses are too similar to keep brainstorming.
+    """
+    previous_words, latest_words = set(previous.lower().split()), set(latest.lower().split())
+    if previous_words | latest_words and len(previous_words & latest_words) / len(previous_words | latest_words) > jaccard_threshold:
+        return True
 
-    if seed == "": #if no seed, generate one
-        print("-----------------------------\nGenerating initial proposal...\n-----------------------------")
-        if additional == "":
-            prompt = f"Given the following problem, propose a solution.\n\nProblem: {problem}\n\nProposed solution:"
-        else:
-            prompt = f"Given the following problem and additional information, propose a solution.\n\nProblem: {problem}\n\nAdditional Information: {additional}\n\nProposed solution:"
-        seed = query_GPT(prompt, engine=args.engine, temp=args.temp, top_p=args.top_p).strip()
-        print(f"\n-----------------------------\nInitial proposal: {seed}\n-----------------------------\n")
-    
-    print("Starting brainstorming session...\n-----------------------------")
+    #the quick ratios are upper bounds on ratio(), so only compute the full ratio if they pass
+    matcher = SequenceMatcher(None, previous, latest)
+    return matcher.real_quick_ratio() > ratio_threshold and matcher.quick_ratio() > ratio_threshold and matcher.ratio() > ratio_threshold
 
-    messages = [seed] #list of messages in the conversation, begins with seed
+async def brainstorm(seed, system_prompt, max_len, seed_tokens=None, enc=None, stream=True, label="", log=None, **gpt_args):
+    """
+    Have two agents brainstorm a solution, starting from a seed proposal.
 
-    #define the system prompt used by both agents in the conversation
-    active_prompt = brainstorming_prompt.format(problem=problem, additional=f"\nAdditional Information: {additional}" if additional != "" else "")
+    Args:
+        seed (str): The initial proposal the conversation starts from.
+        system_prompt (str): The system prompt used by both agents.
+        max_len (int): The maximum number of tokens in the conversation.
+        seed_tokens (int, optional): The number of tokens in the seed if already known. Defaults to None.
+        enc (object, optional): An encoder object used to count tokens. Defaults to the cached cl100k_base encoding.
+        stream (bool, optional): Whether to stream the responses to stdout as they are generated, rather than printing them once done. Defaults to True.
+        label (str, optional): A prefix for the printed responses, to tell concurrent conversations apart. Defaults to "".
+        log (file, optional): An open file the messages are written to as they come in, so an interrupted conversation isn't lost. Defaults to None.
+        **gpt_args: Additional arguments passed to acomplete_GPT (engine, temp, top_p).
 
-    while compute_total_tokens(messages, enc=enc) < args.max_len:
-        max_tokens = args.max_len - compute_total_tokens(messages, enc=enc)
-        agent1_response = chat_GPT(messages, active_prompt, starter="user", engine=args.engine, temp=args.temp, top_p=args.top_p, max_tokens=max_tokens).strip()
+    Returns:
+        list: The messages in the conversation, beginning with the seed.
+    """
+    w = sys.stdout.write #write responses out directly, only flushing once per turn
+    messages = [seed] #list of messages in the conversation, begins with seed
+    token_counter = TokenCounter(enc) #running token count of the conversation
+    token_counter.add(seed, seed_tokens)
+    if log:
+        #the log numbers agents by message index like the synthesis prompt does (the seed is Agent 1), not by which agent replied
+        log.write(f"Agent 1: {seed}\n\n")
+
+    #chat histories sent to each agent, built up alongside messages so they don't get rebuilt every turn
+    #agent 1 sees the seed and agent 2's messages as the user's, agent 2 sees it the other way around
+    agent1_messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": seed}]
+    agent2_messages = [{"role": "system", "content": system_prompt}, {"role": "assistant", "content": seed}]
+
+    while token_counter.total < max_len:
+        max_tokens = max_len - token_counter.total
+        if stream:
+            w(f"{label}Agent 1: ")
+        agent1_response, agent1_tokens = await acomplete_GPT(agent1_messages, max_tokens=max_tokens, stream=stream, **gpt_args)
+        agent1_response = agent1_response.strip()
         messages.append(agent1_response)
-        print(f"Agent 1: {agent1_response}\n-----------------------------\n")
+        agent1_messages.append({"role": "assistant", "content": agent1_response})
+        agent2_messages.append({"role": "user", "content": agent1_response})
+        token_counter.add(agent1_response, agent1_tokens)
+        if log:
+            log.write(f"Agent {(len(messages) - 1) % 2 + 1}: {agent1_response}\n\n")
+        if not stream:
+            w(f"{label}Agent 1: {agent1_response}")
+        w("\n-----------------------------\n\n")
+        sys.stdout.flush()
+
+        if token_counter.total >= max_len: #agent 1 used up the rest of the budget
+            break
+        max_tokens = max_len - token_counter.total #budget agent 2 from agent 1's actual token usage
 
-        agent2_response = chat_GPT(messages, active_prompt, starter="assistant", engine=args.engine, temp=args.temp, top_p=args.top_p, max_tokens=max_tokens).strip()
+        if stream:
+            w(f"{label}Agent 2: ")
+        agent2_response, agent2_tokens = await acomplete_GPT(agent2_messages, max_tokens=max_tokens, stream=stream, **gpt_args)
+        agent2_response = agent2_response.strip()
         messages.append(agent2_response)
-        print(f"Agent 2: {agent2_response}\n-----------------------------\n")
+        agent1_messages.append({"role": "user", "content": agent2_response})
+        agent2_messages.append({"role": "assistant", "content": agent2_response})
+        token_counter.add(agent2_response, agent2_tokens)
+        if log:
+            log.write(f"Agent {(len(messages) - 1) % 2 + 1}: {agent2_response}\n\n")
+        if not stream:
+            w(f"{label}Agent 2: {agent2_response}")
+        w("\n-----------------------------\n\n")
+        sys.stdout.flush()
 
         if len(agent2_response) < 50: #terminate if a response is really small, since it's probably a concluding message
             break
 
-        ##TODO: add a check for if the conversation is going in circles, maybe query GPT with the most recent message and see if it's a concluding message
+        if is_going_in_circles(agent1_response, agent2_response): #terminate if the agents are just repeating each other
+            break
 
-    #synthesize information into cohesive plan
-    print("-----------------------------\nSynthesizing information...\n-----------------------------")
-    conversation_string = ""
-    for i, message in enumerate(messages): #append messages together into a single string
-        conversation_string += f"Agent {i % 2 + 1}: {message}\n\n"
-    conversation_string = conversation_string.strip()
+    return messages
 
-    #change active system prompt to the synthesis prompt
-    active_prompt = synthesis_prompt.format(problem=problem, additional=f"\nAdditional Information: {additional}" if additional != "" else "", conversation=conversation_string)
+async def synthesize(messages, problem, additional, context_len, enc=None, stream=False, **gpt_args):
+    """
+    Synthesize a brainstorming conversation into a single proposal.
 
-    #generate the synthesis
-    synthesis = query_GPT(active_prompt, engine=args.engine, temp=args.temp, top_p=args.top_p, max_tokens=context_len-len(enc.encode(active_prompt))).strip()
+    Args:
+        messages (list): The messages in the conversation.
+        problem (str): The problem statement.
+        additional (str): Any additional information about the problem, empty if none.
+        context_len (int): The context length of the engine.
+        enc (object, optional): An encoder object used to count tokens. Defaults to the cached cl100k_base encoding.
+        stream (bool, optional): Whether to stream the synthesis to stdout as it is generated. Defaults to False.
+        **gpt_args: Additional arguments passed to aquery_GPT (engine, temp, top_p).
 
-    #print results
-    print(f"\n-----------------------------\nSynthesis: {synthesis}\n-----------------------------\n")
-    
-    #export conversation to .txt file
-    with open("conversation.txt", "w") as f:
-        f.write(f"Problem: {problem}\n\nAdditional Information: {additional}\n\nProposed Solution: {seed}\n\n")
-        for i, message in enumerate(messages):
-            f.write(f"Agent {i % 2 + 1}: {message}\n\n")
-    
-    #export synthesis to .txt file
-    with open("synthesis.txt", "w") as f:
-        f.write(f"Problem: {problem}\n\nAdditional Information: {additional}\n\nProposed Solution: {seed}\n\n")
-        f.write(f"Synthesis: {synthesis}\n\n")
-    
-    #make nice HTML file as a writeup
-    html = query_GPT(f"###START REPORT\n{synthesis}\n###END REPORT\n\nReformat the above write-up via HTML into a professional-looking report. Use Times New Roman\n<!DOCTYPE html>", 
-              engine=args.engine, temp=args.temp, top_p=args.top_p, max_tokens=context_len - len(enc.encode(synthesis)))
-    
-    with open("report.html", "w") as f:
-        f.write(html)
+    Returns:
+        tuple: The synthesized proposal and the number of tokens in it.
+    """
+    enc = enc or _get_enc()
+    conversation_string = "\n\n".join(f"Agent {i % 2 + 1}: {message}" for i, message in enumerate(messages)) #join messages together into a single string
+    prompt = synthesis_prompt.format(problem=problem, additional=f"\nAdditional Information: {additional}" if additional != "" else "", conversation=conversation_string)
+    prompt_tokens = len(enc.encode_ordinary(prompt)) #encode the (long) prompt once to budget the response
+
+    synthesis, synthesis_tokens = await aquery_GPT(prompt, max_tokens=context_len-prompt_tokens, stream=stream, **gpt_args)
+    synthesis = synthesis.strip()
+    if synthesis_tokens is None: #not reported by the endpoint, count it ourselves
+        synthesis_tokens = len(enc.encode_ordinary(synthesis))
+    return synthesis, synthesis_tokens
+
+async def pick_best(proposals, problem, additional, context_len, enc=None, **gpt_args):
+    """
+    Ask GPT which of several proposals solves the problem best.
+
+    Args:
+        proposals (list): The candidate proposals, as (proposal, n_tokens) tuples like synthesize returns. n_tokens can be None if unknown.
+        problem (str): The problem statement.
+        additional (str): Any additional information about the problem, empty if none.
+        context_len (int): The context length of the engine.
+        enc (object, optional): An encoder object used to count tokens. Defaults to the cached cl100k_base encoding.
+        **gpt_args: Additional arguments passed to aquery_GPT (engine, temp, top_p).
+
+    Returns:
+        int: The index of the best proposal.
+    """
+    if len(proposals) == 1: #nothing to choose between
+        return 0
+
+    enc = enc or _get_enc()
+    additional = f"\nAdditional Information: {additional}" if additional != "" else ""
+
+    #give every proposal an equal share of the context, cutting off the ends of the ones that don't fit
+    overhead = len(enc.encode_ordinary(ranking_prompt.format(problem=problem, additional=additional, n=len(proposals), proposals="")))
+    share = max((context_len - overhead - 16) // len(proposals) - 16, 0)
+    #only proposals that are (or might be) too long need encoding to be cut off
+    proposals = [proposal if n_tokens is not None and n_tokens <= share else enc.decode(enc.encode_ordinary(proposal)[:share]) for proposal, n_tokens in proposals]
+    proposals_string = "\n\n".join(f"### PROPOSAL {i + 1} ###\n{proposal}" for i, proposal in enumerate(proposals))
+
+    answer, _ = await aquery_GPT(ranking_prompt.format(problem=problem, additional=additional, n=len(proposals), proposals=proposals_string), max_tokens=8, **gpt_args)
+    match = re.search(r"\d+", answer)
+    if match and 1 <= int(match.group()) <= len(proposals):
+        return int(match.group()) - 1
+    return 0 #couldn't make sense of the answer, fall back to the first proposal
+
+def write_txt(path, text):
+    '''
+    Writes text to the file at path
+    '''
+    with open(path, "w") as f:
+        f.write(text)
+
+async def finalize(html_prompt, synthesis_blob, conversation_path="conversation.txt", html=None, max_tokens=512, **gpt_args):
+    """
+    Generate the HTML report while exporting the synthesis (and the conversation it came from) to disk, then export the report.
+
+    Args:
+        html_prompt (str): The prompt asking GPT to reformat the synthesis as HTML.
+        synthesis_blob (str): The contents of synthesis.txt.
+        conversation_path (str, optional): The file the conversation was written to, copied to conversation.txt if it's a different file. Defaults to "conversation.txt".
+        html (str, optional): An already made report, in which case GPT isn't asked for one. Defaults to None.
+        max_tokens (int, optional): The maximum number of tokens in the generated report. Defaults to 512.
+        **gpt_args: Additional arguments passed to aquery_GPT (engine, temp, top_p).
+    """
+    if html is None:
+        html_task = asyncio.create_task(aquery_GPT(html_prompt, max_tokens=max_tokens, **gpt_args))
+    exports = [asyncio.to_thread(write_txt, "synthesis.txt", synthesis_blob)]
+    if conversation_path != "conversation.txt":
+        exports.append(asyncio.to_thread(shutil.copyfile, conversation_path, "conversation.txt"))
+    try:
+        await asyncio.gather(*exports)
+    except BaseException:
+        if html is None: #don't leave the report request running (and its result unretrieved) if an export fails
+            html_task.cancel()
+        raise
+    if html is None:
+        html, _ = await html_task
+    await asyncio.to_thread(write_txt, "report.html", html)
+
+async def main():
+    openai.api_key = "<YOUR_API_KEY_HERE>"
+    enc = _get_enc() #used to count tokens
+
+    #argparser
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--temp", type=float, default=0.8)
+    parser.add_argument("--top_p", type=float, default=0.95)
+    parser.add_argument("--engine", type=str, default="gpt-3.5-turbo")
+    parser.add_argument("--max_len", type=int, default=2048)
+    parser.add_argument("--chains", type=int, default=1) #number of brainstorming sessions to run in parallel, the best result is kept
+    args = parser.parse_args()
+    if args.chains < 1:
+        parser.error("--chains must be at least 1")
+
+    if args.engine == "gpt-3.5-turbo":
+        context_len = 4000
+    elif args.engine == "gpt-4":
+        context_len = 8000
+
+    gpt_args = dict(engine=args.engine, temp=args.temp, top_p=args.top_p)
+    stream = args.chains == 1 #concurrent sessions would interleave their streamed output, so only stream a single session
+
+    async with _get_aclient(): #close the shared client's connections when done, even on errors
+        print("Welcome to BrainstormGPT 🧠⛈️\n-----------------------------")
+        problem = input("Describe the problem you want to solve: ") #problem statement
+        additional = input("Describe any additional information you want to provide (leave blank if none): ") #any additional info
+        seed = input("Enter any initial proposals you have (leave blank if none): ") #seed idea
+
+        if seed == "": #if no seed, generate one for each session
+            print("-----------------------------\nGenerating initial proposal...\n-----------------------------")
+            if additional == "":
+                prompt = f"Given the following problem, propose a solution.\n\nProblem: {problem}\n\nProposed solution:"
+            else:
+                prompt = f"Given the following problem and additional information, propose a solution.\n\nProblem: {problem}\n\nAdditional Information: {additional}\n\nProposed solution:"
+            if stream:
+                print("\n-----------------------------\nInitial proposal: ", end="")
+                seeds = [await aquery_GPT(prompt, stream=True, **gpt_args)]
+                print("\n-----------------------------\n")
+            else:
+                seeds = await asyncio.gather(*(aquery_GPT(prompt, **gpt_args) for _ in range(args.chains)))
+                for i, (chain_seed, _) in enumerate(seeds):
+                    print(f"\n-----------------------------\nInitial proposal {i + 1}: {chain_seed.strip()}\n-----------------------------\n")
+            seeds = [(chain_seed.strip(), seed_tokens) for chain_seed, seed_tokens in seeds]
+        else:
+            seeds = [(seed, None)] * args.chains
     
+        print("Starting brainstorming session...\n-----------------------------")
+
+        #define the system prompt used by both agents in the conversation
+        active_prompt = brainstorming_prompt.format(problem=problem, additional=f"\nAdditional Information: {additional}" if additional != "" else "")
+
+        #write each conversation to disk as it goes, one file per session when there are several
+        header = "Problem: {problem}\n\nAdditional Information: {additional}\n\nProposed Solution: {seed}\n\n"
+        paths = ["conversation.txt"] if args.chains == 1 else [f"conversation_{i + 1}.txt" for i in range(args.chains)]
+        with contextlib.ExitStack() as stack:
+            logs = [stack.enter_context(open(path, "w", buffering=1)) for path in paths]
+            for log, (chain_seed, _) in zip(logs, seeds):
+                log.write(header.format(problem=problem, additional=additional, seed=chain_seed))
+
+            chains = await asyncio.gather(*(brainstorm(chain_seed, active_prompt, args.max_len, seed_tokens=seed_tokens, enc=enc, stream=stream, label="" if stream else f"[Session {i + 1}] ", log=log, **gpt_args)
+                                            for i, ((chain_seed, seed_tokens), log) in enumerate(zip(seeds, logs))))
+
+        #synthesize information into cohesive plan
+        print("-----------------------------\nSynthesizing information...\n-----------------------------")
+        if stream:
+            print("\n-----------------------------\nSynthesis: ", end="")
+            syntheses = [await synthesize(chains[0], problem, additional, context_len, enc=enc, stream=True, **gpt_args)]
+            print("\n-----------------------------\n")
+            best = 0
+        else:
+            syntheses = await asyncio.gather(*(synthesize(messages, problem, additional, context_len, enc=enc, **gpt_args) for messages in chains))
+            best = await pick_best(syntheses, problem, additional, context_len, enc=enc, **gpt_args)
+            print(f"\n-----------------------------\nSynthesis (from session {best + 1}): {syntheses[best][0]}\n-----------------------------\n")
+        seed, (synthesis, synthesis_tokens) = seeds[best][0], syntheses[best]
     
+        #make nice HTML file as a writeup, exporting the conversation and synthesis to .txt files while we wait
+        #budget the report from the synthesis' token count reported by the API, only encoding the template around it
+        active_prompt = report_prompt.format(synthesis=synthesis)
+        prompt_tokens = len(enc.encode_ordinary(report_prompt.format(synthesis=""))) + synthesis_tokens
+        synthesis_blob = header.format(problem=problem, additional=additional, seed=seed) + f"Synthesis: {synthesis}\n\n"
+        html = None
+        if len(synthesis) < 500: #not worth a GPT call for a really short synthesis, just wrap it in a plain page
+            html = report_template.format(body=escape(synthesis).replace("\n", "<br>\n"))
+        await finalize(active_prompt, synthesis_blob, conversation_path=paths[best], html=html, max_tokens=context_len-prompt_tokens, **gpt_args)
+
+if __name__ == "__main__":
+    asyncio.run(main())